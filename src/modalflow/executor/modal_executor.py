@@ -1,22 +1,80 @@
 from __future__ import annotations
 
+import asyncio
+import functools
 import os
-from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Union
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, Final, List, Optional, Sequence, Tuple
 
-import modal
 from airflow.executors.base_executor import BaseExecutor
 from airflow.executors import workloads as executor_workloads
 from airflow.models.taskinstance import TaskInstanceKey
 
+from modalflow.payload import ModalTaskPayload
+
 if TYPE_CHECKING:
+    # modal pulls in grpc and protobuf, so it is only imported where it's used
+    # to keep `import modalflow.executor.modal_executor` cheap for the scheduler
+    import modal
     from airflow.executors.workloads import All as ExecutorWorkload
 
-# Type alias for command - can be a list containing a workload or list of strings
-CommandType = Union[List[executor_workloads.ExecuteTask], List[str]]
+__all__ = ["ModalExecutor"]
+
+# Bound once so the per-task isinstance checks don't re-fetch the module attribute
+_ExecuteTask = executor_workloads.ExecuteTask
+
 
 # Configuration - should match modal_app.py
-ENV = os.environ.get("MODALFLOW_ENV", "main")
-CONCURRENCY_LIMIT = 100
+ENV: Final[str] = os.environ.get("MODALFLOW_ENV", "main")
+CONCURRENCY_LIMIT: Final[int] = 100
+
+# Maximum number of FunctionCall polls kept in flight at once during sync()
+# Each poll is its own RPC, so they are issued concurrently on an event loop
+POLL_CONCURRENCY: Final[int] = 32
+
+# Maximum number of .spawn() RPCs kept in flight at once when dispatching workloads
+SPAWN_WORKERS: Final[int] = 16
+
+# Seconds between direct FunctionCall polls in sync()
+# Completions normally arrive on the completion queue; this is the fallback for
+# tasks whose worker died (or lost its event) before publishing one
+RECONCILE_INTERVAL: Final[int] = 60
+
+# Modal releases (major, minor), inclusive, whose experimental_spawn_map was checked
+# to take a list of inputs and return one FunctionCall addressed by input index
+# It is a hidden, experimental API, so other releases use single spawns instead
+BATCHED_SPAWN_MODAL_VERSIONS: Final[Tuple[Tuple[int, int], Tuple[int, int]]] = ((1, 3), (1, 6))
+
+# Environment variables passed to every task's worker
+_TASK_ENV: Final[Dict[str, str]] = {
+    "AIRFLOW__CORE__EXECUTOR": "modalflow.executor.modal_executor.ModalExecutor",
+}
+
+
+@functools.lru_cache(maxsize=4096)
+def _format_key_str(dag_id: str, task_id: str, run_id: str, try_number: int) -> str:
+    """
+    Build the string key for a task attempt.
+    Memoized since the same key is serialized on dispatch and again on retries/re-queues.
+    """
+    return ":".join((dag_id, task_id, run_id, str(try_number)))
+
+
+@functools.lru_cache(maxsize=None)
+def _batched_spawn_supported() -> bool:
+    """
+    Whether the installed Modal SDK is one whose experimental_spawn_map we rely on.
+    """
+    import modal
+
+    try:
+        major, minor = (int(part) for part in modal.__version__.split(".")[:2])
+    except ValueError:
+        return False
+    oldest, newest = BATCHED_SPAWN_MODAL_VERSIONS
+    return oldest <= (major, minor) <= newest
 
 
 class ModalExecutor(BaseExecutor):
@@ -27,10 +85,20 @@ class ModalExecutor(BaseExecutor):
     def __init__(self):
         # Use the same concurrency limit as the Modal function
         super().__init__(parallelism=CONCURRENCY_LIMIT)
-        self.active_tasks: Dict[str, TaskInstanceKey] = {}
-        # These will be initialized in start()
-        self._modal_function = None
-        self._state_dict = None
+        # Maps task_key -> (TaskInstanceKey, FunctionCall, output index)
+        # The index is 0 for .spawn() calls, and the input's position for batched spawns
+        self.active_tasks: Dict[str, Tuple[TaskInstanceKey, modal.FunctionCall, int]] = {}
+        # This executor's partition of the completion queue
+        # Its workers publish there, so executors sharing an ENV don't read each other's events
+        self._completion_partition = uuid.uuid4().hex
+        # Reconcile on the first sync
+        self._last_reconcile = float("-inf")
+        # Event loop for the concurrent FunctionCall polls, reused across syncs
+        # Created on the first reconcile, so executors that never sync don't hold one open
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._spawn_pool = ThreadPoolExecutor(
+            max_workers=SPAWN_WORKERS, thread_name_prefix="modalflow-spawn"
+        )
 
     @property
     def slots_available(self) -> int:
@@ -42,90 +110,108 @@ class ModalExecutor(BaseExecutor):
 
     def start(self):
         """
-        Initialize the executor by looking up the deployed Modal function and state dict.
+        Initialize the executor by looking up the deployed Modal function and completion queue.
+
+        The lookups are memoized, so starting an executor again reuses them.
         """
         self.log.info("Starting ModalExecutor")
 
+        # Touch the lookups now so a missing deployment fails at startup
+        # rather than on the first spawn
+        self._modal_function
+        self._completion_queue
+
+    @functools.cached_property
+    def _modal_function(self) -> modal.Function:
+        """
+        The deployed execute_modal_task function, looked up on first access.
+
+        from_name() is lazy, so the handle is hydrated here to check that the app is deployed.
+        """
+        import modal
+
         app_name = f"modalflow-{ENV}"
-        dict_name = f"airflow-state-{ENV}"
 
         # Look up the deployed Modal function
         try:
-            self._modal_function = modal.Function.from_name(
-                app_name, "execute_modal_task"
-            )
+            modal_function = modal.Function.from_name(app_name, "execute_modal_task")
+            modal_function.hydrate()
             self.log.info(f"Connected to Modal function: {app_name}/execute_modal_task")
         except Exception as e:
             self.log.error(
                 f"Failed to look up Modal function {app_name}/execute_modal_task: {e}"
             )
             raise
+        return modal_function
 
-        # Look up the state dictionary
+    @functools.cached_property
+    def _completion_queue(self) -> modal.Queue:
+        """
+        The queue workers publish completion events to, looked up on first access.
+
+        Hydrated here for the same reason as _modal_function.
+        """
+        import modal
+
+        queue_name = f"airflow-completions-{ENV}"
+
+        # Look up the completion queue
         try:
-            self._state_dict = modal.Dict.from_name(dict_name)
-            self.log.info(f"Connected to Modal Dict: {dict_name}")
+            # Workers only create the queue on their first put, so a fresh
+            # deploy has none yet
+            completion_queue = modal.Queue.from_name(queue_name, create_if_missing=True)
+            completion_queue.hydrate()
+            self.log.info(f"Connected to Modal Queue: {queue_name}")
         except Exception as e:
-            self.log.error(f"Failed to connect to Modal Dict {dict_name}: {e}")
+            self.log.error(f"Failed to connect to Modal Queue {queue_name}: {e}")
             raise
+        return completion_queue
 
     def execute_async(
         self,
         key: TaskInstanceKey,
-        command: CommandType,
+        command: _ExecuteTask,
         queue: Optional[str] = None,
         executor_config: Optional[Any] = None,
     ) -> None:
         """
         Trigger a task execution on Modal.
 
-        Following the Airflow 3.x pattern (like AWS Lambda Executor), the command
-        parameter is a list containing an ExecuteTask workload object. We serialize
-        it to JSON and pass it to the Modal function, which executes it using the
-        Airflow SDK's execute_workload module.
+        Following the Airflow 3.x pattern, command is an ExecuteTask workload (the
+        parameter keeps BaseExecutor's name). We serialize it to JSON and pass it to
+        the Modal function, which executes it using the Airflow SDK's execute_workload module.
+
+        The scheduler dispatches through _process_workloads, which batches its spawns;
+        this is the single-task entry point of the BaseExecutor interface.
         """
         # Serialize the key to use as a unique ID
         task_key_str = self._get_key_str(key)
-
-        # Handle Airflow 3.x workload pattern (command contains ExecuteTask object)
-        if len(command) == 1 and isinstance(command[0], executor_workloads.ExecuteTask):
-            workload = command[0]
-            # Serialize the workload to JSON using pydantic's model_dump_json
-            serialized_workload = workload.model_dump_json()
-        else:
-            raise RuntimeError(
-                f"ModalExecutor doesn't know how to handle command of type: {type(command)}"
-            )
+        payload = self._build_payload(task_key_str, key, command, executor_config)
 
         self.log.info(f"Spawning Modal task for {task_key_str}")
 
-        # Prepare payload with serialized workload
-        # The Modal function will use airflow.sdk.execution_time.execute_workload
-        payload = {
-            "task_key": task_key_str,
-            "workload_json": serialized_workload,
-            "env": self._get_task_env(key, executor_config),
-        }
-
         # Spawn the function asynchronously
-        # .spawn() returns a FunctionCall object, but we rely on the Dict for status
-        try:
-            self._modal_function.spawn(payload)
-            self.active_tasks[task_key_str] = key
-        except Exception as e:
-            self.log.error(f"Failed to spawn Modal task: {e}")
+        # We keep the returned FunctionCall and poll it for completion in sync()
+        function_call, error = self._spawn(payload)
+        if error is not None:
+            self.log.error(f"Failed to spawn Modal task: {error}")
             self.fail(key)
+            return
+        self.active_tasks[task_key_str] = (key, function_call, 0)
 
     def _process_workloads(self, workloads: Sequence[ExecutorWorkload]) -> None:
         """
-        Process workloads by delegating to execute_async.
+        Process workloads by spawning them on Modal.
         This is the Airflow 3.x API for task execution.
 
-        Following the same pattern as the AWS Lambda Executor, we pass the workload
-        object wrapped in a list as the 'command' parameter.
+        Payloads are built the same way as in execute_async, but they are submitted
+        together: in a single batched spawn when the Modal SDK supports it, otherwise
+        as concurrent .spawn() RPCs, so dispatching N workloads costs ~1 RTT instead of N.
         """
+        pending = []
+
         for workload in workloads:
-            if not isinstance(workload, executor_workloads.ExecuteTask):
+            if not isinstance(workload, _ExecuteTask):
                 raise RuntimeError(
                     f"{type(self).__name__} cannot handle workloads of type {type(workload)}"
                 )
@@ -141,70 +227,241 @@ class ModalExecutor(BaseExecutor):
                 map_index=ti.map_index,
             )
 
-            queue = ti.queue
             executor_config = ti.executor_config or {}
 
             # Remove from queued tasks if tracked by base class
             if key in self.queued_tasks:
                 del self.queued_tasks[key]
 
-            # Pass the workload wrapped in a list (following Lambda executor pattern)
-            command = [workload]
-            self.execute_async(
-                key=key,
-                command=command,
-                queue=queue,
-                executor_config=executor_config,
-            )
+            task_key_str = self._get_key_str(key)
+            payload = self._build_payload(task_key_str, key, workload, executor_config)
+            pending.append((task_key_str, key, payload))
+            self.log.info(f"Spawning Modal task for {task_key_str}")
+
+        spawned = self._spawn_many([payload for _, _, payload in pending])
+
+        # Record the results on the scheduler thread
+        for (task_key_str, key, _), (function_call, index, error) in zip(pending, spawned):
             self.running.add(key)
+            if error is not None:
+                self.log.error(f"Failed to spawn Modal task {task_key_str}: {error}")
+                self.fail(key)
+                continue
+            self.active_tasks[task_key_str] = (key, function_call, index)
+
+    def _build_payload(
+        self,
+        task_key_str: str,
+        key: TaskInstanceKey,
+        workload: _ExecuteTask,
+        executor_config: Optional[Any],
+    ) -> ModalTaskPayload:
+        """
+        Build the payload passed to the Modal function for a single task.
+        """
+        # Prepare payload with serialized workload
+        # The Modal function will use airflow.sdk.execution_time.execute_workload
+        return ModalTaskPayload(
+            task_key=task_key_str,
+            # Serialize the workload to JSON using pydantic's model_dump_json
+            workload_json=workload.model_dump_json(),
+            env=self._get_task_env(key, executor_config),
+            # Shipped as a field so the worker doesn't need to parse the workload
+            log_path=workload.log_path,
+            completion_partition=self._completion_partition,
+        )
+
+    def _spawn(
+        self, payload: ModalTaskPayload
+    ) -> Tuple[Optional[modal.FunctionCall], Optional[Exception]]:
+        """
+        Spawn the Modal function for a payload.
+        Returns (function_call, error) so it can be mapped over a thread pool without raising.
+        """
+        try:
+            return self._modal_function.spawn(payload.to_dict()), None
+        except Exception as e:
+            return None, e
+
+    def _spawn_many(
+        self, payloads: List[ModalTaskPayload]
+    ) -> List[Tuple[Optional[modal.FunctionCall], int, Optional[Exception]]]:
+        """
+        Spawn the Modal function for several payloads at once.
+        Returns (function_call, output_index, error) for each payload, in order.
+        """
+        # experimental_spawn_map submits every input in one control-plane call and
+        # returns a single FunctionCall whose outputs are addressed by input index
+        # (the public spawn_map doesn't return a handle, so we can't track it)
+        # It is hidden and experimental, and its signature or return value may change
+        # in any release, so it is only used on the versions it was checked against
+        spawn_map = None
+        if len(payloads) > 1 and _batched_spawn_supported():
+            spawn_map = getattr(self._modal_function, "experimental_spawn_map", None)
+        if spawn_map is not None:
+            try:
+                function_call = spawn_map([payload.to_dict() for payload in payloads])
+            except Exception as e:
+                return [(None, 0, e)] * len(payloads)
+            return [(function_call, index, None) for index in range(len(payloads))]
+
+        # Fall back to concurrent single spawns
+        return [
+            (function_call, 0, error)
+            for function_call, error in self._spawn_pool.map(self._spawn, payloads)
+        ]
 
     def sync(self) -> None:
         """
         Check the status of running tasks.
+
+        Workers push completion events onto a Modal Queue, which is drained in a
+        single RPC. Every RECONCILE_INTERVAL seconds the FunctionCalls are also polled
+        directly, to catch tasks whose worker died before it could publish an event.
         """
         if not self.active_tasks:
             return
 
-        # Poll the state dictionary
-        # TODO: batch this or use a more efficient lookup
-
-        completed_keys = []
+        results = self._drain_completions()
 
-        for task_key_str, key in self.active_tasks.items():
-            # Check if this key exists in the remote dict
-            # We use .get() to avoid errors if key is missing
-            try:
-                task_state = self._state_dict.get(task_key_str)
-            except Exception as e:
-                self.log.warning(f"Error reading state for {task_key_str}: {e}")
-                continue
-
-            if not task_state:
-                # Task not yet registered by worker, or lost
-                # TODO: implement a timeout logic here
-                continue
+        now = time.monotonic()
+        if now - self._last_reconcile >= RECONCILE_INTERVAL:
+            self._last_reconcile = now
+            results.update(
+                self._poll_function_calls(
+                    [k for k in self.active_tasks if k not in results]
+                )
+            )
 
-            status = task_state.get("status")
+        # results is its own dict, so finished tasks can be dropped from
+        # active_tasks in place, with no second cleanup pass
+        for task_key_str, (status, error_msg) in results.items():
+            key, _, _ = self.active_tasks[task_key_str]
 
             if status == "SUCCESS":
                 self.success(key)
-                completed_keys.append(task_key_str)
+                self.active_tasks.pop(task_key_str, None)
                 self.log.info(f"Task {task_key_str} succeeded")
 
             elif status == "FAILED":
                 self.fail(key)
-                completed_keys.append(task_key_str)
-                error_msg = task_state.get("error", "Unknown error")
-                self.log.error(f"Task {task_key_str} failed: {error_msg}")
-
-        # Cleanup local state
-        for k in completed_keys:
-            del self.active_tasks[k]
-            # Cleanup remote state
-            try:
-                self._state_dict.pop(k)
-            except Exception as e:
-                self.log.warning(f"Failed to cleanup remote state for {k}: {e}") 
+                self.active_tasks.pop(task_key_str, None)
+                self.log.error(f"Task {task_key_str} failed: {error_msg or 'Unknown error'}")
+
+    def _drain_completions(self) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+        """
+        Drain the completion events published by workers, without blocking.
+        Returns {task_key: (status, error)} for the tasks this executor is tracking.
+
+        Only this executor's partition is read, so other schedulers on the same ENV
+        (e.g. in an HA setup) keep their own events.
+        """
+        try:
+            events = self._completion_queue.get_many(
+                len(self.active_tasks), block=False, partition=self._completion_partition
+            )
+        except Exception as e:
+            self.log.warning(f"Error reading completion events: {e}")
+            return {}
+
+        return {
+            event["task_key"]: (event.get("status"), event.get("error"))
+            for event in events
+            # Events for tasks we aren't tracking (e.g. from before a restart) are dropped
+            if event.get("task_key") in self.active_tasks
+        }
+
+    def _poll_function_calls(
+        self, task_keys: List[str]
+    ) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+        """
+        Poll the FunctionCalls of the given tasks without blocking.
+        Returns {task_key: (status, error)} for the tasks that have finished.
+        """
+        import modal.exception
+
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+
+        # A client or control-plane error (e.g. a dropped connection) affects every poll
+        # in the batch, so it is handled once here: the batch is abandoned and retried
+        # on the next reconcile
+        try:
+            return self._loop.run_until_complete(self._gather_finished(task_keys))
+        except modal.exception.Error as e:
+            self.log.warning(f"Error polling function calls: {e}")
+            return {}
+
+    async def _gather_finished(
+        self, task_keys: List[str]
+    ) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+        """
+        Issue all the polls concurrently on the event loop and collect results as they land,
+        so a reconcile costs ~1 RTT instead of N.
+        """
+        in_flight = asyncio.Semaphore(POLL_CONCURRENCY)
+
+        async def poll(task_key_str: str):
+            _, function_call, index = self.active_tasks[task_key_str]
+            async with in_flight:
+                return task_key_str, await self._poll_function_call(function_call, index)
+
+        polls = [asyncio.ensure_future(poll(k)) for k in task_keys]
+        finished = {}
+        try:
+            for next_done in asyncio.as_completed(polls):
+                task_key_str, result = await next_done
+                if result[0] is not None:
+                    finished[task_key_str] = result
+        finally:
+            # Don't leave polls running on the loop if the batch was abandoned
+            for pending_poll in polls:
+                pending_poll.cancel()
+        return finished
+
+    async def _poll_function_call(
+        self, function_call: modal.FunctionCall, index: int = 0
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Check whether a spawned Modal function call (or one input of a batched spawn) has finished.
+        Returns (status, error), where status is None while the call is still running.
+        """
+        import modal.exception
+
+        # Modal errors that describe how the worker's call ended
+        worker_errors = (
+            modal.exception.RemoteError,
+            modal.exception.ExecutionError,
+            modal.exception.InternalFailure,
+        )
+
+        try:
+            result = await function_call.get.aio(timeout=0, index=index)
+        except modal.exception.FunctionTimeoutError as e:
+            # The worker was killed at the function timeout, so it never published an event
+            return "FAILED", f"Modal function timed out: {e}"
+        except modal.exception.OutputExpiredError as e:
+            # The call finished so long ago that its result is gone - we can't tell how it went
+            return "FAILED", f"Function call output expired: {e}"
+        except TimeoutError:
+            # Still running - Modal raises the builtin TimeoutError when there's no output
+            # yet, which is unrelated to modal.exception.TimeoutError
+            return None, None
+        except worker_errors as e:
+            # The worker crashed, or raised something that couldn't be rebuilt locally
+            return "FAILED", str(e)
+        except modal.exception.Error:
+            # Any other Modal error comes from the client or control plane, not the task,
+            # so it is handled for the whole batch by _poll_function_calls
+            raise
+        except Exception as e:
+            # Modal re-raises exceptions from the worker locally
+            return "FAILED", str(e)
+
+        if not isinstance(result, dict):
+            # e.g. a worker deployed from an older release that didn't return its state
+            return "FAILED", f"Unexpected result from Modal function: {result!r}"
+        return result.get("status", "FAILED"), result.get("error")
 
     def end(self) -> None:
         """
@@ -212,6 +469,10 @@ class ModalExecutor(BaseExecutor):
         """
         self.log.info("Shutting down ModalExecutor")
         self.heartbeat_interval = 0
+        if self._loop is not None:
+            self._loop.close()
+            self._loop = None
+        self._spawn_pool.shutdown(wait=False)
 
     def terminate(self) -> None:
         """
@@ -226,7 +487,7 @@ class ModalExecutor(BaseExecutor):
         """
         # Note: TaskInstanceKey is a named tuple, but the fields vary slightly by Airflow version
         # We construct a stable string key
-        return f"{key.dag_id}:{key.task_id}:{key.run_id}:{key.try_number}"
+        return _format_key_str(key.dag_id, key.task_id, key.run_id, key.try_number)
 
     def _get_task_env(self, key: TaskInstanceKey, executor_config: Any) -> Dict[str, str]:
         """
@@ -235,6 +496,5 @@ class ModalExecutor(BaseExecutor):
         # BaseExecutor doesn't inherently give us the full task env.
         # But we can pass specific vars if needed.
         # For now, we return a basic set.
-        return {
-            "AIRFLOW__CORE__EXECUTOR": "modalflow.executor.modal_executor.ModalExecutor",
-        }
+        # This is a shared module-level dict - callers must not mutate it
+        return _TASK_ENV
@@ -1,8 +1,12 @@
+import json
 import os
 import subprocess
+import traceback
 
 import modal
 
+from modalflow.payload import ModalTaskPayload
+
 # Allow overriding the environment name via env var
 ENV = os.environ.get("MODALFLOW_ENV", "main")
 
@@ -10,6 +14,27 @@ ENV = os.environ.get("MODALFLOW_ENV", "main")
 # This should match the executor's parallelism setting
 CONCURRENCY_LIMIT = 100
 
+# Bytes of output read back from the end of the log file for the returned
+# state record; the full output only goes to the log file
+OUTPUT_TAIL_BYTES = 2000
+
+# Snapshot of the container's environment, taken once when the container boots
+# Task subprocesses are started from this instead of copying os.environ per task
+_BASE_ENV = os.environ.copy()
+
+# Where the log volume is mounted; the Airflow supervisor writes each task's log
+# under here, at the workload's log_path (base_log_folder in the official image)
+LOG_ROOT = "/opt/airflow/logs"
+
+# Mirror each task's terminal state into the state dict
+# Off by default: the executor reads results from the FunctionCall, so this
+# only costs an extra RPC per task unless something else consumes the dict
+USE_DICT_STATUS = bool(os.environ.get("MODALFLOW_USE_DICT_STATUS"))
+
+# Run workloads by calling the Airflow SDK in the worker process
+# Setting MODALFLOW_SUBPROCESS_EXECUTION falls back to one `python -m` subprocess per task
+IN_PROCESS_EXECUTION = not os.environ.get("MODALFLOW_SUBPROCESS_EXECUTION")
+
 # Define the base image
 # We use the official Airflow image to ensure compatibility
 airflow_image = modal.Image.from_registry(
@@ -21,6 +46,16 @@ airflow_image = modal.Image.from_registry(
     "pyyaml",
     "psycopg2-binary",
 )
+# Carry deploy-time settings into the worker containers
+if USE_DICT_STATUS:
+    airflow_image = airflow_image.env({"MODALFLOW_USE_DICT_STATUS": "1"})
+if not IN_PROCESS_EXECUTION:
+    airflow_image = airflow_image.env({"MODALFLOW_SUBPROCESS_EXECUTION": "1"})
+
+# Imported once per container instead of once per task
+with airflow_image.imports():
+    from airflow.executors import workloads as _workloads
+    from airflow.sdk.execution_time import execute_workload as _execute_workload
 
 # Create the Modal App
 app = modal.App(f"modalflow-{ENV}", image=airflow_image)
@@ -31,36 +66,157 @@ log_volume = modal.Volume.from_name(f"airflow-logs-{ENV}", create_if_missing=Tru
 
 # Define the dict for coordination (hot cache)
 # Maps task_key -> {status, return_code, last_updated}
+# The executor tracks completion through the FunctionCall itself, so this is
+# only written when USE_DICT_STATUS is set, and writes to it are best-effort
 state_dict = modal.Dict.from_name(f"airflow-state-{ENV}", create_if_missing=True)
 
 
+def _record_state(task_key: str, state: dict) -> None:
+    """
+    Write a task's state to the state dict without letting a Dict outage fail the task.
+
+    The state is stored as compact JSON bytes so readers get a plain blob instead of
+    a pickled dict.
+    """
+    if not USE_DICT_STATUS:
+        return
+    try:
+        state_dict[task_key] = json.dumps(state, separators=(",", ":")).encode()
+    except Exception as e:
+        print(f"Warning: Failed to record state for {task_key}: {e}")
+
+
+# Define the queue for completion events
+# Workers push one envelope per finished task and the executor drains it in sync(),
+# so steady-state polling costs one RPC regardless of how many tasks are running
+# Each executor reads its own partition, named in the task payload
+completion_queue = modal.Queue.from_name(
+    f"airflow-completions-{ENV}", create_if_missing=True
+)
+
+
+def _publish_completion(task_key: str, state: dict, partition: str) -> None:
+    """
+    Push a task's terminal state onto the dispatching executor's partition of the completion queue.
+    Best-effort: the executor still falls back to polling the FunctionCall if this is lost.
+    """
+    try:
+        # Don't block: put() otherwise waits forever on a full queue, hanging the
+        # worker until the function timeout
+        completion_queue.put(
+            {
+                "task_key": task_key,
+                "status": state["status"],
+                "return_code": state.get("return_code"),
+                "error": state.get("error"),
+            },
+            block=False,
+            partition=partition,
+        )
+    except Exception as e:
+        print(f"Warning: Failed to publish completion for {task_key}: {e}")
+
+
 @app.function(
-    volumes={"/opt/airflow/logs": log_volume},
+    volumes={LOG_ROOT: log_volume},
     timeout=3600,  # Default 1 hour timeout
     max_containers=CONCURRENCY_LIMIT,
 )
-def execute_modal_task(payload: dict):
+def execute_modal_task(payload: dict) -> dict:
     """
     Executes an Airflow task using the Airflow SDK's execute_workload module.
 
     This follows the same pattern as the AWS Lambda Executor for Airflow 3.x.
+    By default the workload runs in this process; deploying with
+    MODALFLOW_SUBPROCESS_EXECUTION set runs it via `python -m ...execute_workload` instead.
 
-    Payload structure:
+    Payload structure (a ModalTaskPayload, sent as a dict):
     {
         "task_key": "dag_id:task_id:run_id:try_number",
         "workload_json": "<serialized ExecuteTask workload JSON>",
-        "env": {"AIRFLOW__CORE__...", ...}
+        "env": {"AIRFLOW__CORE__...", ...},
+        "log_path": "dag_id=.../run_id=.../task_id=.../attempt=1.log",
+        "completion_partition": "<executor's completion queue partition>"
     }
-    """
-    import json
-    import os
 
-    task_key = payload.get("task_key")
-    workload_json = payload.get("workload_json")
-    env_vars = payload.get("env", {})
+    Returns the terminal state record ({status, return_code, ...}), which the
+    executor reads back through the FunctionCall returned by .spawn().
+    """
+    task = ModalTaskPayload.from_dict(payload)
+    task_key = task.task_key
+    workload_json = task.workload_json
+    env_vars = task.env
 
     print(f"Starting execution for {task_key}")
 
+    try:
+        if IN_PROCESS_EXECUTION:
+            return_code = _execute_in_process(workload_json, env_vars)
+            # Output went straight to Modal's logs; the tail comes from the task log
+            # the Airflow supervisor wrote, as in the subprocess path
+            output_tail = _read_log_tail(task)
+        else:
+            return_code, output_tail = _execute_subprocess(task)
+
+        status = "SUCCESS" if return_code == 0 else "FAILED"
+
+        state = {
+            "status": status,
+            "return_code": return_code,
+            # Last 2KB of the task log for quick debug
+            "output": output_tail,
+        }
+        if status == "FAILED":
+            state["error"] = f"Task exited with return code {return_code}"
+
+    except Exception as e:
+        print(f"Execution failed: {e}")
+        state = {
+            "status": "FAILED",
+            "return_code": -1,
+            "error": str(e),
+        }
+        _record_state(task_key, state)
+        _publish_completion(task_key, state, task.completion_partition)
+        raise
+
+    _record_state(task_key, state)
+    _publish_completion(task_key, state, task.completion_partition)
+    return state
+
+
+def _execute_in_process(workload_json: str, env_vars: dict) -> int:
+    """
+    Run the workload through the Airflow SDK's execute_workload in this process.
+
+    This skips the interpreter start and Airflow import a subprocess pays on every
+    task; the SDK's supervisor still forks its own child for the task itself.
+    Returns 0 on success and 1 if the SDK raised, like the subprocess's exit code.
+    """
+    # There's no subprocess boundary, so apply the payload's env to this process
+    # Container values still win, and the added keys are removed afterwards
+    added_env = {k: v for k, v in env_vars.items() if k not in os.environ}
+    os.environ.update(added_env)
+    try:
+        workload = _workloads.ExecuteTask.model_validate_json(workload_json)
+        _execute_workload.execute_workload(workload)
+    except Exception:
+        traceback.print_exc()
+        return 1
+    finally:
+        for k in added_env:
+            os.environ.pop(k, None)
+    return 0
+
+
+def _execute_subprocess(task: ModalTaskPayload) -> tuple:
+    """
+    Run the workload with `python -m airflow.sdk.execution_time.execute_workload`.
+
+    The subprocess inherits this process's stdout and stderr, so its output goes to
+    Modal's logs, and the Airflow supervisor writes the task log on the volume itself.
+    Returns (return_code, output_tail).
+    """
     # Build the Airflow SDK execute_workload command
     # This is how Airflow 3.x executes tasks remotely (same as Lambda Executor)
     command = [
@@ -68,7 +224,7 @@ def execute_modal_task(payload: dict):
         "-m",
         "airflow.sdk.execution_time.execute_workload",
         "--json-string",
-        workload_json,
+        task.workload_json,
     ]
 
     print(
@@ -77,79 +233,30 @@ def execute_modal_task(payload: dict):
 
     # Set environment variables
     # We must merge with existing env to keep system paths
-    run_env = os.environ.copy()
-    for k, v in env_vars.items():
-        if k not in run_env:
-            run_env[k] = v
-
-    # Try to extract task info from workload for logging
-    log_file_path = None
-    try:
-        workload_data = json.loads(workload_json)
-        ti = workload_data.get("ti", {})
-        dag_id = ti.get("dag_id", "unknown")
-        task_id = ti.get("task_id", "unknown")
-        run_id = ti.get("run_id", "unknown")
-        try_number = ti.get("try_number", 1)
-
-        # Construct path: /opt/airflow/logs/dag_id/task_id/run_id/try_number.log
-        log_dir = os.path.join(
-            "/opt/airflow/logs",
-            f"dag_id={dag_id}",
-            f"run_id={run_id}",
-            f"task_id={task_id}",
-        )
-        os.makedirs(log_dir, exist_ok=True)
-        log_file_path = os.path.join(log_dir, f"attempt={try_number}.log")
-        print(f"Writing logs to {log_file_path}")
-    except Exception as e:
-        print(f"Warning: Failed to setup log directory structure: {e}")
-
-    # Update state to RUNNING right before execution
-    state_dict[task_key] = {
-        "status": "RUNNING",
-        "return_code": None,
-        "ts": 0,  # Timestamp placeholder
-    }
+    # Container values win over the payload's, so they are unpacked last
+    run_env = {**task.env, **_BASE_ENV}
 
-    try:
-        # Run the command
-        # We use subprocess.run to block until completion
-        result = subprocess.run(
-            command,
-            env=run_env,
-            capture_output=True,
-            text=True,
-            check=False,
-        )
+    # Run the command
+    # The task log file belongs to the supervisor, so the output isn't redirected into it
+    result = subprocess.run(command, env=run_env, check=False)
 
-        # Log output to Modal's centralized logging
-        print("STDOUT:", result.stdout)
-        print("STDERR:", result.stderr)
+    return result.returncode, _read_log_tail(task)
 
-        # Write output to the log file on the volume
-        if log_file_path:
-            try:
-                with open(log_file_path, "w") as f:
-                    f.write(f"*** STDOUT ***\n{result.stdout}\n")
-                    f.write(f"*** STDERR ***\n{result.stderr}\n")
-            except Exception as e:
-                print(f"Failed to write log file: {e}")
 
-        status = "SUCCESS" if result.returncode == 0 else "FAILED"
-
-        state_dict[task_key] = {
-            "status": status,
-            "return_code": result.returncode,
-            "stdout": result.stdout[-2000:],  # Store last 2KB for quick debug
-            "stderr": result.stderr[-2000:],
-        }
+def _read_log_tail(task: ModalTaskPayload) -> str:
+    """
+    Read the last OUTPUT_TAIL_BYTES of the task log the Airflow supervisor wrote.
+    The file is only opened for reading, after the task has exited.
+    """
+    if not task.log_path:
+        return ""
 
-    except Exception as e:
-        print(f"Execution failed: {e}")
-        state_dict[task_key] = {
-            "status": "FAILED",
-            "return_code": -1,
-            "error": str(e),
-        }
-        raise
+    log_file_path = os.path.join(LOG_ROOT, task.log_path)
+    try:
+        with open(log_file_path, "rb") as log_file:
+            size = log_file.seek(0, os.SEEK_END)
+            log_file.seek(max(0, size - OUTPUT_TAIL_BYTES))
+            return log_file.read().decode(errors="replace")
+    except OSError as e:
+        print(f"Failed to read back log file {log_file_path}: {e}")
+        return ""
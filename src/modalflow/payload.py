@@ -0,0 +1,40 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+
+@dataclass(frozen=True, slots=True)
+class ModalTaskPayload:
+    """
+    Everything the Modal worker needs to run one task attempt.
+
+    Shared by the executor (which builds it) and modal_app (which reads it).
+    It travels as a plain dict, so deployed workers don't depend on pickling this class.
+    """
+
+    task_key: str
+    workload_json: str
+    env: Dict[str, str]
+    # Where the Airflow supervisor writes the task log, relative to the log root
+    log_path: Optional[str]
+    # Queue partition of the executor that dispatched the task, for its completion event
+    completion_partition: str
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert to the dict sent to the Modal function.
+        Shallow, unlike dataclasses.asdict, which would deep-copy env for every task.
+        """
+        return {
+            "task_key": self.task_key,
+            "workload_json": self.workload_json,
+            "env": self.env,
+            "log_path": self.log_path,
+            "completion_partition": self.completion_partition,
+        }
+
+    @classmethod
+    def from_dict(cls, payload: Dict[str, Any]) -> "ModalTaskPayload":
+        """
+        Rebuild the payload on the worker side, failing loudly on a schema mismatch.
+        """
+        return cls(**payload)
@@ -0,0 +1,197 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from modalflow import modal_app
+from modalflow.payload import ModalTaskPayload
+
+LOG_PATH = "dag_id=dag/run_id=run_id/task_id=task/attempt=1.log"
+
+
+def _make_task(env=None):
+    return ModalTaskPayload(
+        task_key="dag:task:run_id:1",
+        workload_json='{"ti": {}}',
+        env=env or {},
+        log_path=LOG_PATH,
+        completion_partition="executor-partition",
+    )
+
+
+class TestExecuteModalTask(unittest.TestCase):
+    def setUp(self):
+        self.publish = mock.patch.object(modal_app, "_publish_completion").start()
+        self.record = mock.patch.object(modal_app, "_record_state").start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_in_process_by_default(self):
+        task = _make_task()
+        with mock.patch.object(
+            modal_app, "_execute_in_process", return_value=0
+        ) as in_process, mock.patch.object(
+            modal_app, "_read_log_tail", return_value="task log tail"
+        ) as read_log_tail:
+            state = modal_app.execute_modal_task.local(task.to_dict())
+
+        in_process.assert_called_once_with(task.workload_json, task.env)
+        read_log_tail.assert_called_once_with(task)
+        self.assertEqual(
+            state, {"status": "SUCCESS", "return_code": 0, "output": "task log tail"}
+        )
+        self.publish.assert_called_once_with(task.task_key, state, "executor-partition")
+        self.record.assert_called_once_with(task.task_key, state)
+
+    def test_subprocess_when_configured(self):
+        task = _make_task()
+        with mock.patch.object(modal_app, "IN_PROCESS_EXECUTION", False), mock.patch.object(
+            modal_app, "_execute_subprocess", return_value=(2, "boom")
+        ):
+            state = modal_app.execute_modal_task.local(task.to_dict())
+
+        self.assertEqual(state["status"], "FAILED")
+        self.assertEqual(state["return_code"], 2)
+        self.assertEqual(state["output"], "boom")
+        self.assertEqual(state["error"], "Task exited with return code 2")
+
+    def test_exception_is_published_and_reraised(self):
+        task = _make_task()
+        with mock.patch.object(
+            modal_app, "_execute_in_process", side_effect=RuntimeError("no workload")
+        ):
+            with self.assertRaises(RuntimeError):
+                modal_app.execute_modal_task.local(task.to_dict())
+
+        state = self.publish.call_args[0][1]
+        self.assertEqual(state, {"status": "FAILED", "return_code": -1, "error": "no workload"})
+
+
+class TestExecuteInProcess(unittest.TestCase):
+    def setUp(self):
+        self.workloads = mock.patch.object(modal_app, "_workloads", create=True).start()
+        self.execute_workload = mock.patch.object(
+            modal_app, "_execute_workload", create=True
+        ).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_applies_and_restores_env(self):
+        seen = {}
+
+        def execute(workload):
+            seen["added"] = os.environ.get("MODALFLOW_TEST_ADDED")
+            seen["existing"] = os.environ.get("MODALFLOW_TEST_EXISTING")
+
+        self.execute_workload.execute_workload.side_effect = execute
+        env = {"MODALFLOW_TEST_ADDED": "payload", "MODALFLOW_TEST_EXISTING": "payload"}
+
+        with mock.patch.dict(os.environ, {"MODALFLOW_TEST_EXISTING": "container"}):
+            return_code = modal_app._execute_in_process('{"ti": {}}', env)
+
+            self.assertEqual(return_code, 0)
+            # Container values win over the payload's
+            self.assertEqual(seen, {"added": "payload", "existing": "container"})
+            self.assertNotIn("MODALFLOW_TEST_ADDED", os.environ)
+            self.assertEqual(os.environ["MODALFLOW_TEST_EXISTING"], "container")
+
+        self.workloads.ExecuteTask.model_validate_json.assert_called_once_with('{"ti": {}}')
+        self.execute_workload.execute_workload.assert_called_once_with(
+            self.workloads.ExecuteTask.model_validate_json.return_value
+        )
+
+    def test_failure_returns_one_and_restores_env(self):
+        self.execute_workload.execute_workload.side_effect = RuntimeError("task failed")
+
+        return_code = modal_app._execute_in_process('{"ti": {}}', {"MODALFLOW_TEST_ADDED": "1"})
+
+        self.assertEqual(return_code, 1)
+        self.assertNotIn("MODALFLOW_TEST_ADDED", os.environ)
+
+
+class TestExecuteSubprocess(unittest.TestCase):
+    def setUp(self):
+        log_root = tempfile.TemporaryDirectory()
+        self.addCleanup(log_root.cleanup)
+        self.log_root = log_root.name
+        mock.patch.object(modal_app, "LOG_ROOT", self.log_root).start()
+        self.run = mock.patch.object(modal_app.subprocess, "run").start()
+        self.run.return_value.returncode = 0
+        self.addCleanup(mock.patch.stopall)
+
+    def _write_log(self, content):
+        log_file_path = os.path.join(self.log_root, LOG_PATH)
+        os.makedirs(os.path.dirname(log_file_path))
+        with open(log_file_path, "wb") as log_file:
+            log_file.write(content)
+
+    def test_returns_code_and_log_tail(self):
+        self._write_log(b"x" * 5000 + b"y" * modal_app.OUTPUT_TAIL_BYTES)
+        self.run.return_value.returncode = 3
+
+        return_code, output_tail = modal_app._execute_subprocess(_make_task())
+
+        self.assertEqual(return_code, 3)
+        self.assertEqual(output_tail, "y" * modal_app.OUTPUT_TAIL_BYTES)
+
+    def test_output_is_not_redirected(self):
+        with mock.patch.dict(modal_app._BASE_ENV, {"PATH": "/container/bin"}, clear=True):
+            modal_app._execute_subprocess(_make_task(env={"PATH": "/payload/bin", "A": "1"}))
+
+        kwargs = self.run.call_args.kwargs
+        # The supervisor owns the task log, so stdout/stderr are inherited
+        self.assertNotIn("stdout", kwargs)
+        self.assertNotIn("stderr", kwargs)
+        self.assertEqual(kwargs["env"], {"PATH": "/container/bin", "A": "1"})
+
+    def test_missing_log_gives_empty_tail(self):
+        return_code, output_tail = modal_app._execute_subprocess(_make_task())
+
+        self.assertEqual(return_code, 0)
+        self.assertEqual(output_tail, "")
+
+
+class TestStateReporting(unittest.TestCase):
+    def test_record_state_disabled_by_default(self):
+        with mock.patch.object(modal_app, "USE_DICT_STATUS", False), mock.patch.object(
+            modal_app, "state_dict"
+        ) as state_dict:
+            modal_app._record_state("key", {"status": "SUCCESS"})
+
+        state_dict.__setitem__.assert_not_called()
+
+    def test_record_state_stores_json_bytes(self):
+        with mock.patch.object(modal_app, "USE_DICT_STATUS", True), mock.patch.object(
+            modal_app, "state_dict"
+        ) as state_dict:
+            modal_app._record_state("key", {"status": "SUCCESS", "return_code": 0})
+
+        state_dict.__setitem__.assert_called_once_with(
+            "key", b'{"status":"SUCCESS","return_code":0}'
+        )
+
+    def test_record_state_swallows_errors(self):
+        with mock.patch.object(modal_app, "USE_DICT_STATUS", True), mock.patch.object(
+            modal_app, "state_dict"
+        ) as state_dict:
+            state_dict.__setitem__.side_effect = ConnectionError("Dict unavailable")
+            modal_app._record_state("key", {"status": "SUCCESS"})
+
+    def test_publish_completion_does_not_block(self):
+        with mock.patch.object(modal_app, "completion_queue") as completion_queue:
+            modal_app._publish_completion(
+                "key", {"status": "FAILED", "error": "boom"}, "executor-partition"
+            )
+
+        completion_queue.put.assert_called_once_with(
+            {"task_key": "key", "status": "FAILED", "return_code": None, "error": "boom"},
+            block=False,
+            partition="executor-partition",
+        )
+
+    def test_publish_completion_swallows_errors(self):
+        with mock.patch.object(modal_app, "completion_queue") as completion_queue:
+            completion_queue.put.side_effect = ConnectionError("Queue unavailable")
+            modal_app._publish_completion("key", {"status": "SUCCESS"}, "executor-partition")
+
+
+if __name__ == "__main__":
+    unittest.main()
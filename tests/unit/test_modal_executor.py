@@ -1,13 +1,18 @@
+import asyncio
 import sys
 from unittest import mock
+import time
 import unittest
 
+import modal
+
 # --- Mock Airflow Dependencies ---
 # This allows running tests without installing heavy airflow dependencies
 mock_airflow = mock.MagicMock()
 sys.modules["airflow"] = mock_airflow
 sys.modules["airflow.executors"] = mock_airflow.executors
 sys.modules["airflow.executors.base_executor"] = mock_airflow.executors.base_executor
+sys.modules["airflow.executors.workloads"] = mock_airflow.executors.workloads
 sys.modules["airflow.models"] = mock_airflow.models
 sys.modules["airflow.models.taskinstance"] = mock_airflow.models.taskinstance
 sys.modules["airflow.utils"] = mock_airflow.utils
@@ -17,6 +22,9 @@ sys.modules["airflow.utils.state"] = mock_airflow.utils.state
 class MockBaseExecutor:
     def __init__(self, parallelism=16):
         self.parallelism = parallelism
+        self.log = mock.MagicMock()
+        self.running = set()
+        self.queued_tasks = {}
     def fail(self, key): pass
     def success(self, key): pass
     def validate_command(self, cmd): pass
@@ -25,91 +33,498 @@ mock_airflow.executors.base_executor.BaseExecutor = MockBaseExecutor
 
 # Mock TaskInstanceKey class
 class MockTaskInstanceKey:
-    def __init__(self, dag_id, task_id, run_id, try_number):
+    def __init__(self, dag_id, task_id, run_id, try_number, map_index=-1):
         self.dag_id = dag_id
         self.task_id = task_id
         self.run_id = run_id
         self.try_number = try_number
+        self.map_index = map_index
 
 mock_airflow.models.taskinstance.TaskInstanceKey = MockTaskInstanceKey
 
+# Mock ExecuteTask workload class
+class MockExecuteTask:
+    def __init__(self, workload_json='{"ti": {}}', ti=None, log_path=None):
+        self.workload_json = workload_json
+        self.ti = ti
+        self.log_path = log_path
+    def model_dump_json(self):
+        return self.workload_json
+
+mock_airflow.executors.workloads.ExecuteTask = MockExecuteTask
+
 # --- Import Code Under Test ---
 # We must do this AFTER mocking
-from modalflow.executor.modal_executor import ModalExecutor
+from modalflow.executor.modal_executor import ENV, ModalExecutor, _batched_spawn_supported
 
 class TestModalExecutor(unittest.TestCase):
     def setUp(self):
         self.executor = ModalExecutor()
         self.executor.active_tasks = {}
+        self.executor._completion_queue = mock.MagicMock()
+        self.executor._completion_queue.get_many.return_value = []
+
+    @mock.patch("modal.Queue.from_name")
+    @mock.patch("modal.Function.from_name")
+    def test_start_looks_up_once(self, function_from_name, queue_from_name):
+        # Drop the mocks installed by setUp so the real lookups run
+        del self.executor._completion_queue
+
+        self.executor.start()
+        self.executor.start()
+
+        function_from_name.assert_called_once_with(f"modalflow-{ENV}", "execute_modal_task")
+        queue_from_name.assert_called_once_with(
+            f"airflow-completions-{ENV}", create_if_missing=True
+        )
+        function_from_name.return_value.hydrate.assert_called_once_with()
+        queue_from_name.return_value.hydrate.assert_called_once_with()
+        self.assertIs(self.executor._modal_function, function_from_name.return_value)
 
-    @mock.patch("modalflow.executor.modal_executor.execute_modal_task")
-    def test_execute_async(self, mock_task):
+    @mock.patch("modal.Function.from_name")
+    def test_start_missing_deployment(self, function_from_name):
+        # from_name() itself never fails, the missing app only surfaces on hydrate()
+        function_from_name.return_value.hydrate.side_effect = modal.exception.NotFoundError(
+            "App not found"
+        )
+
+        with self.assertRaises(modal.exception.NotFoundError):
+            self.executor.start()
+
+    def test_execute_async(self):
+        self.executor._modal_function = mock.MagicMock()
         key = MockTaskInstanceKey("dag", "task", "run_id", 1)
-        command = ["airflow", "tasks", "run", "dag", "task", "run_id", "--local"]
-        
-        self.executor.execute_async(key, command)
-        
+        workload = MockExecuteTask(
+            '{"ti": {"dag_id": "dag"}}', log_path="dag_id=dag/run_id=run_id/task_id=task/attempt=1.log"
+        )
+
+        self.executor.execute_async(key, workload)
+
         # Verify spawn called
-        mock_task.spawn.assert_called_once()
-        call_args = mock_task.spawn.call_args[0][0]
+        self.executor._modal_function.spawn.assert_called_once()
+        call_args = self.executor._modal_function.spawn.call_args[0][0]
         self.assertEqual(call_args["task_key"], "dag:task:run_id:1")
-        self.assertEqual(call_args["command"], command)
-        
+        self.assertEqual(call_args["workload_json"], '{"ti": {"dag_id": "dag"}}')
+        self.assertEqual(
+            call_args["log_path"], "dag_id=dag/run_id=run_id/task_id=task/attempt=1.log"
+        )
+        self.assertEqual(call_args["completion_partition"], self.executor._completion_partition)
+
         # Verify added to active tasks
         self.assertIn("dag:task:run_id:1", self.executor.active_tasks)
 
-    @mock.patch("modalflow.executor.modal_executor.state_dict")
-    def test_sync_success(self, mock_state_dict):
+    def test_execute_async_tracks_function_call(self):
+        self.executor._modal_function = mock.MagicMock()
         key = MockTaskInstanceKey("dag", "task", "run_id", 1)
-        task_key_str = "dag:task:run_id:1"
-        self.executor.active_tasks[task_key_str] = key
-        
-        # Mock successful state
-        mock_state_dict.get.return_value = {"status": "SUCCESS"}
-        
+
+        self.executor.execute_async(key, command=MockExecuteTask())
+
+        function_call = self.executor._modal_function.spawn.return_value
+        self.assertEqual(self.executor.active_tasks["dag:task:run_id:1"], (key, function_call, 0))
+
+    def _make_workload(self, task_id="task"):
+        ti = mock.Mock(
+            dag_id="dag",
+            task_id=task_id,
+            run_id="run_id",
+            try_number=1,
+            map_index=-1,
+            queue="default",
+            executor_config=None,
+        )
+        return MockExecuteTask(f'{{"ti": {{"task_id": "{task_id}"}}}}', ti=ti)
+
+    def _use_modal_version(self, version):
+        # The batched spawn gate is memoized, so reset it around the patched version
+        _batched_spawn_supported.cache_clear()
+        self.addCleanup(_batched_spawn_supported.cache_clear)
+        patcher = mock.patch.object(modal, "__version__", version)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_process_workloads(self):
+        # The version pinned in uv.lock
+        self._use_modal_version("1.3.0.post1")
+        self.executor._modal_function = mock.MagicMock()
+        workloads = [self._make_workload(f"task_{i}") for i in range(20)]
+
+        self.executor._process_workloads(workloads)
+
+        # All workloads go out in one batched spawn
+        spawn_map = self.executor._modal_function.experimental_spawn_map
+        spawn_map.assert_called_once()
+        self.executor._modal_function.spawn.assert_not_called()
+        payloads = spawn_map.call_args[0][0]
+        self.assertEqual(
+            [p["task_key"] for p in payloads], [f"dag:task_{i}:run_id:1" for i in range(20)]
+        )
+
+        # Each task polls its own output of the batched FunctionCall
+        for i in range(20):
+            _, function_call, index = self.executor.active_tasks[f"dag:task_{i}:run_id:1"]
+            self.assertIs(function_call, spawn_map.return_value)
+            self.assertEqual(index, i)
+        self.assertEqual(len(self.executor.running), 20)
+
+    def test_process_workloads_batched_spawn_failure(self):
+        self._use_modal_version("1.6.1")
+        self.executor._modal_function = mock.MagicMock()
+        self.executor._modal_function.experimental_spawn_map.side_effect = ConnectionError("boom")
+        self.executor.fail = mock.Mock()
+
+        self.executor._process_workloads([self._make_workload("a"), self._make_workload("b")])
+
+        self.assertEqual(self.executor.active_tasks, {})
+        self.assertEqual(self.executor.fail.call_count, 2)
+
+    def test_process_workloads_without_batched_spawn(self):
+        self.executor._modal_function = mock.MagicMock(spec=["spawn"])
+        workloads = [self._make_workload(f"task_{i}") for i in range(20)]
+
+        self.executor._process_workloads(workloads)
+
+        self.assertEqual(self.executor._modal_function.spawn.call_count, 20)
+        spawned = {c[0][0]["task_key"] for c in self.executor._modal_function.spawn.call_args_list}
+        self.assertEqual(spawned, {f"dag:task_{i}:run_id:1" for i in range(20)})
+        self.assertEqual(len(self.executor.active_tasks), 20)
+        self.assertEqual(len(self.executor.running), 20)
+
+    def test_process_workloads_unchecked_modal_version(self):
+        self.executor._modal_function = mock.MagicMock()
+
+        for version in ("1.2.0", "1.7.0"):
+            with self.subTest(version=version):
+                self._use_modal_version(version)
+                self.executor._process_workloads(
+                    [self._make_workload(f"task_{version}_{i}") for i in range(3)]
+                )
+
+        # experimental_spawn_map is only trusted on the Modal releases it was checked against
+        self.executor._modal_function.experimental_spawn_map.assert_not_called()
+        self.assertEqual(self.executor._modal_function.spawn.call_count, 6)
+
+    def test_process_workloads_spawn_failure(self):
+        self.executor._modal_function = mock.MagicMock(spec=["spawn"])
+        self.executor._modal_function.spawn.side_effect = [mock.Mock(), ConnectionError("boom")]
+        self.executor.fail = mock.Mock()
+
+        # Spawn from a single thread so side_effect order matches workload order
+        self.executor._spawn_pool = mock.Mock(map=map)
+        self.executor._process_workloads([self._make_workload("ok"), self._make_workload("bad")])
+
+        self.assertIn("dag:ok:run_id:1", self.executor.active_tasks)
+        self.assertNotIn("dag:bad:run_id:1", self.executor.active_tasks)
+        self.executor.fail.assert_called_once()
+        self.assertEqual(self.executor.fail.call_args[0][0].task_id, "bad")
+
+    def test_process_workloads_rejects_unknown_workload(self):
+        self.executor._modal_function = mock.MagicMock()
+
+        with self.assertRaises(RuntimeError):
+            self.executor._process_workloads([object()])
+
+        self.executor._modal_function.spawn.assert_not_called()
+
+    def _track(self, task_id="task"):
+        """Register a running task backed by a mock FunctionCall."""
+        key = MockTaskInstanceKey("dag", task_id, "run_id", 1)
+        task_key_str = f"dag:{task_id}:run_id:1"
+        function_call = self._mock_function_call()
+        self.executor.active_tasks[task_key_str] = (key, function_call, 0)
+        return key, task_key_str, function_call
+
+    def _mock_function_call(self):
+        """A mock FunctionCall whose async .get.aio delegates to the sync .get mock."""
+        function_call = mock.Mock()
+        function_call.get.aio = mock.AsyncMock(
+            side_effect=lambda *args, **kwargs: function_call.get(*args, **kwargs)
+        )
+        return function_call
+
+    def test_sync_success(self):
+        key, task_key_str, function_call = self._track()
+
+        # Mock successful result
+        function_call.get.return_value = {"status": "SUCCESS", "return_code": 0}
+
         # Mock airflow methods
         self.executor.success = mock.Mock()
         self.executor.fail = mock.Mock()
-        
+
         self.executor.sync()
-        
+
+        function_call.get.assert_called_once_with(timeout=0, index=0)
         self.executor.success.assert_called_once_with(key)
         self.executor.fail.assert_not_called()
         self.assertNotIn(task_key_str, self.executor.active_tasks)
 
-    @mock.patch("modalflow.executor.modal_executor.state_dict")
-    def test_sync_failed(self, mock_state_dict):
-        key = MockTaskInstanceKey("dag", "task", "run_id", 1)
-        task_key_str = "dag:task:run_id:1"
-        self.executor.active_tasks[task_key_str] = key
-        
-        # Mock failed state
-        mock_state_dict.get.return_value = {"status": "FAILED", "error": "Something exploded"}
-        
+    def test_event_loop_created_on_first_reconcile(self):
+        self.assertIsNone(self.executor._loop)
+
+        _, _, function_call = self._track()
+        function_call.get.side_effect = TimeoutError()
+        self.executor.sync()
+
+        loop = self.executor._loop
+        self.assertIsNotNone(loop)
+
+        self.executor.end()
+
+        self.assertTrue(loop.is_closed())
+        self.assertIsNone(self.executor._loop)
+
+    def test_sync_failed(self):
+        key, task_key_str, function_call = self._track()
+
+        # Mock failed result
+        function_call.get.return_value = {"status": "FAILED", "return_code": 1}
+
         # Mock airflow methods
         self.executor.success = mock.Mock()
         self.executor.fail = mock.Mock()
-        
+
         self.executor.sync()
-        
+
         self.executor.fail.assert_called_once_with(key)
         self.executor.success.assert_not_called()
         self.assertNotIn(task_key_str, self.executor.active_tasks)
 
-    @mock.patch("modalflow.executor.modal_executor.state_dict")
-    def test_sync_pending(self, mock_state_dict):
-        key = MockTaskInstanceKey("dag", "task", "run_id", 1)
-        task_key_str = "dag:task:run_id:1"
-        self.executor.active_tasks[task_key_str] = key
-        
-        # Mock pending state (or missing state)
-        mock_state_dict.get.return_value = {"status": "RUNNING"}
-        
+    def test_sync_worker_exception(self):
+        key, task_key_str, function_call = self._track()
+
+        # Modal re-raises exceptions from the worker
+        function_call.get.side_effect = RuntimeError("Something exploded")
+
+        self.executor.success = mock.Mock()
+        self.executor.fail = mock.Mock()
+
+        self.executor.sync()
+
+        self.executor.fail.assert_called_once_with(key)
+        self.executor.success.assert_not_called()
+        self.assertNotIn(task_key_str, self.executor.active_tasks)
+
+    def test_sync_pending(self):
+        key, task_key_str, function_call = self._track()
+
+        # Call hasn't produced output yet - Modal raises the builtin TimeoutError
+        function_call.get.side_effect = TimeoutError()
+
+        self.executor.success = mock.Mock()
+        self.executor.fail = mock.Mock()
+
+        self.executor.sync()
+
+        self.executor.success.assert_not_called()
+        self.executor.fail.assert_not_called()
+        self.assertIn(task_key_str, self.executor.active_tasks)
+
+    def test_sync_connection_error_abandons_batch(self):
+        for i in range(5):
+            _, _, function_call = self._track(f"task_{i}")
+            function_call.get.return_value = {"status": "SUCCESS"}
+        _, _, broken = self._track("broken")
+        broken.get.side_effect = modal.exception.ConnectionError("Modal unavailable")
+
+        self.executor.success = mock.Mock()
+        self.executor.fail = mock.Mock()
+
+        self.executor.sync()
+
+        self.executor.fail.assert_not_called()
+        self.assertIn("dag:broken:run_id:1", self.executor.active_tasks)
+        # Nothing is left running on the loop
+        self.assertEqual(asyncio.all_tasks(self.executor._loop), set())
+
+    def test_sync_output_expired(self):
+        key, task_key_str, function_call = self._track()
+
+        function_call.get.side_effect = modal.exception.OutputExpiredError()
+
+        self.executor.success = mock.Mock()
+        self.executor.fail = mock.Mock()
+
+        self.executor.sync()
+
+        self.executor.fail.assert_called_once_with(key)
+        self.assertNotIn(task_key_str, self.executor.active_tasks)
+
+    def test_sync_function_timeout(self):
+        key, task_key_str, function_call = self._track()
+
+        # Killed at the function timeout - FunctionTimeoutError subclasses modal's TimeoutError
+        function_call.get.side_effect = modal.exception.FunctionTimeoutError("timed out")
+
+        self.executor.success = mock.Mock()
+        self.executor.fail = mock.Mock()
+
+        self.executor.sync()
+
+        self.executor.fail.assert_called_once_with(key)
+        self.assertNotIn(task_key_str, self.executor.active_tasks)
+
+    def test_sync_worker_crash(self):
+        key, task_key_str, function_call = self._track()
+
+        function_call.get.side_effect = modal.exception.RemoteError("container crashed")
+
+        self.executor.fail = mock.Mock()
+
+        self.executor.sync()
+
+        self.executor.fail.assert_called_once_with(key)
+        self.assertNotIn(task_key_str, self.executor.active_tasks)
+
+    def test_sync_client_error_is_retried(self):
+        key, task_key_str, function_call = self._track()
+
+        # Not about the task, so it must not be reported as a task failure
+        function_call.get.side_effect = modal.exception.ClientClosed("client closed")
+
+        self.executor.success = mock.Mock()
+        self.executor.fail = mock.Mock()
+
+        self.executor.sync()
+
+        self.executor.success.assert_not_called()
+        self.executor.fail.assert_not_called()
+        self.assertIn(task_key_str, self.executor.active_tasks)
+
+    def test_sync_unexpected_result(self):
+        key, task_key_str, function_call = self._track()
+
+        # Workers from older releases returned nothing
+        function_call.get.return_value = None
+
+        self.executor.success = mock.Mock()
+        self.executor.fail = mock.Mock()
+
+        self.executor.sync()
+
+        self.executor.success.assert_not_called()
+        self.executor.fail.assert_called_once_with(key)
+        self.assertNotIn(task_key_str, self.executor.active_tasks)
+
+    def test_sync_many_tasks(self):
+        # Even-numbered tasks succeeded, odd-numbered ones are still running
+        for i in range(50):
+            _, _, function_call = self._track(f"task_{i}")
+            if i % 2 == 0:
+                function_call.get.return_value = {"status": "SUCCESS"}
+            else:
+                function_call.get.side_effect = TimeoutError()
+
+        self.executor.success = mock.Mock()
+        self.executor.fail = mock.Mock()
+
+        self.executor.sync()
+
+        self.assertEqual(self.executor.success.call_count, 25)
+        self.executor.fail.assert_not_called()
+        self.assertEqual(len(self.executor.active_tasks), 25)
+
+    def test_sync_batched_spawn_outputs(self):
+        key_a = MockTaskInstanceKey("dag", "a", "run_id", 1)
+        key_b = MockTaskInstanceKey("dag", "b", "run_id", 1)
+        function_call = self._mock_function_call()
+        self.executor.active_tasks["dag:a:run_id:1"] = (key_a, function_call, 0)
+        self.executor.active_tasks["dag:b:run_id:1"] = (key_b, function_call, 1)
+
+        def get(timeout=None, index=0):
+            if index == 1:
+                return {"status": "SUCCESS"}
+            raise TimeoutError()
+
+        function_call.get.side_effect = get
+        self.executor.success = mock.Mock()
+
+        self.executor.sync()
+
+        self.executor.success.assert_called_once_with(key_b)
+        self.assertEqual(list(self.executor.active_tasks), ["dag:a:run_id:1"])
+
+    def test_sync_completion_event(self):
+        key, task_key_str, function_call = self._track()
+        self.executor._completion_queue.get_many.return_value = [
+            {"task_key": task_key_str, "status": "SUCCESS", "return_code": 0, "error": None}
+        ]
+        # Not due for a reconcile
+        self.executor._last_reconcile = time.monotonic()
         self.executor.success = mock.Mock()
+
+        self.executor.sync()
+
+        self.executor._completion_queue.get_many.assert_called_once_with(
+            1, block=False, partition=self.executor._completion_partition
+        )
+        self.executor.success.assert_called_once_with(key)
+        function_call.get.assert_not_called()
+        self.assertNotIn(task_key_str, self.executor.active_tasks)
+
+    def test_sync_failed_completion_event(self):
+        key, task_key_str, function_call = self._track()
+        self.executor._completion_queue.get_many.return_value = [
+            {"task_key": task_key_str, "status": "FAILED", "return_code": 1, "error": "boom"}
+        ]
         self.executor.fail = mock.Mock()
-        
+
         self.executor.sync()
-        
+
+        self.executor.fail.assert_called_once_with(key)
+        # Already resolved by the event, so it isn't polled during the reconcile
+        function_call.get.assert_not_called()
+        self.assertNotIn(task_key_str, self.executor.active_tasks)
+
+    def test_executors_use_separate_completion_partitions(self):
+        # Schedulers sharing an ENV must not drain each other's events
+        self.assertNotEqual(
+            self.executor._completion_partition, ModalExecutor()._completion_partition
+        )
+
+    def test_sync_ignores_unknown_completion_events(self):
+        key, task_key_str, function_call = self._track()
+        self.executor._completion_queue.get_many.return_value = [
+            {"task_key": "dag:other:run_id:1", "status": "SUCCESS"}
+        ]
+        self.executor._last_reconcile = time.monotonic()
+        self.executor.success = mock.Mock()
+
+        self.executor.sync()
+
+        self.executor.success.assert_not_called()
+        self.assertIn(task_key_str, self.executor.active_tasks)
+
+    def test_sync_skips_reconcile_within_interval(self):
+        key, task_key_str, function_call = self._track()
+        function_call.get.return_value = {"status": "SUCCESS"}
+        self.executor._last_reconcile = time.monotonic()
+
+        self.executor.sync()
+
+        function_call.get.assert_not_called()
+        self.assertIn(task_key_str, self.executor.active_tasks)
+
+    def test_sync_queue_error(self):
+        key, task_key_str, function_call = self._track()
+        self.executor._completion_queue.get_many.side_effect = ConnectionError("Queue unavailable")
+        function_call.get.return_value = {"status": "SUCCESS"}
+        self.executor.success = mock.Mock()
+
+        self.executor.sync()
+
+        # Falls back to the FunctionCall
+        self.executor.success.assert_called_once_with(key)
+
+    def test_sync_connection_error(self):
+        key, task_key_str, function_call = self._track()
+
+        function_call.get.side_effect = modal.exception.ConnectionError("Modal unavailable")
+
+        self.executor.success = mock.Mock()
+        self.executor.fail = mock.Mock()
+
+        self.executor.sync()
+
         self.executor.success.assert_not_called()
         self.executor.fail.assert_not_called()
         self.assertIn(task_key_str, self.executor.active_tasks)
@@ -0,0 +1,32 @@
+import dataclasses
+import unittest
+
+from modalflow.payload import ModalTaskPayload
+
+
+class TestModalTaskPayload(unittest.TestCase):
+    def setUp(self):
+        self.payload = ModalTaskPayload(
+            task_key="dag:task:run_id:1",
+            workload_json='{"ti": {}}',
+            env={"AIRFLOW__CORE__EXECUTOR": "modalflow.executor.modal_executor.ModalExecutor"},
+            log_path="dag_id=dag/run_id=run_id/task_id=task/attempt=1.log",
+            completion_partition="executor-partition",
+        )
+
+    def test_dict_round_trip(self):
+        as_dict = self.payload.to_dict()
+
+        self.assertEqual(as_dict, dataclasses.asdict(self.payload))
+        self.assertEqual(ModalTaskPayload.from_dict(as_dict), self.payload)
+
+    def test_from_dict_rejects_unknown_fields(self):
+        as_dict = self.payload.to_dict()
+        as_dict["command"] = ["airflow", "tasks", "run"]
+
+        with self.assertRaises(TypeError):
+            ModalTaskPayload.from_dict(as_dict)
+
+
+if __name__ == "__main__":
+    unittest.main()